@@ -6,62 +6,210 @@ Created on Wed Dec  4 13:25:24 2019
 @author: skoebric
 """
 # --- Python Library Imports ---
-import datetime
 import requests
 import json
 import concurrent.futures as cf
 import os
+import zipfile
 
 # --- Package Imports ---
 import pandas as pd
 import numpy as np
-import wbdata as wb
 import pycountry
     
 # --- Module Imports ---
 import config
 import helper_functions
 
-def wb_query(indicator, countries='all', start_year=config.START_YEAR, end_year=config.END_YEAR, iso3=True):
+def wb_query_page(url, params, page, timeout=60):
     """
-    Retrieve data for a world bank indicator,
+    Helper function to request a single page from the World Bank API.
+    
+    Outputs
+    -------
+    (dict, list) - page metadata and the list of records on that page.
+    """
+    
+    r = requests.get(url, params=dict(params, page=page), timeout=timeout)
+    
+    # --- Process API request ---
+    if r.ok:
+        j = json.loads(r.content)
+    else: r.raise_for_status()
+    
+    # --- Unknown indicators / countries still return 200 with a message ---
+    if 'message' in j[0]:
+        raise RuntimeError(f"World Bank API error for {url}: {j[0]['message']}")
+    
+    if j[1] is None:
+        return j[0], []
+    return j[0], j[1]
+
+def wb_records_to_arrays(records):
+    """Pull the country, year, value, and indicator fields out of World Bank API records as arrays."""
+    
+    country = np.array([d['country']['value'] for d in records], dtype=object)
+    year = np.array([d['date'] for d in records], dtype=object).astype(int)
+    value = np.array([d['value'] for d in records], dtype=float) #None becomes nan
+    indicator = np.array([d['indicator']['id'] for d in records], dtype=object)
+    
+    return country, year, value, indicator
+
+def wb_api_query(indicators, countries='all', start_year=config.START_YEAR, end_year=config.END_YEAR,
+                 per_page=20000, max_workers=20, timeout=60):
+    """
+    Fetch one or more indicators from the World Bank REST API.
+    
+    Each indicator is requested with a large page size so it usually fits on one page,
+    and all indicators (and any extra pages) are requested concurrently with concurrent.futures.
+    *timeout* (seconds) applies to each page request.
+    
+    Outputs
+    -------
+    Pandas DataFrame - Long, with columns for 'country','year','value', and 'indicator'
+    """
+    
+    if countries != 'all':
+        countries = ';'.join(countries)
+    
+    params = {'format':'json',
+              'date':f'{start_year}:{end_year}',
+              'per_page':per_page}
+    urls = [f'https://api.worldbank.org/v2/country/{countries}/indicator/{i}' for i in indicators]
+    
+    pages = []
+    with cf.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        
+        # --- Request first page of each indicator ---
+        futures = [executor.submit(wb_query_page, url, params, 1, timeout) for url in urls]
+        later_futures = []
+        for url, f in zip(urls, futures):
+            meta, records = f.result()
+            pages.append(records)
+            
+            # --- Request any remaining pages ---
+            n_pages = int(meta.get('pages', 1) or 1)
+            later_futures += [executor.submit(wb_query_page, url, params, p, timeout) for p in range(2, n_pages + 1)]
+        
+        for f in cf.as_completed(later_futures):
+            pages.append(f.result()[1])
+    
+    # --- Package results as arrays ---
+    arrays = [wb_records_to_arrays(records) for records in pages if len(records) > 0]
+    if len(arrays) == 0:
+        return pd.DataFrame(columns=['country','year','value','indicator'])
+    country, year, value, indicator = [np.concatenate(a) for a in zip(*arrays)]
+    
+    df = pd.DataFrame({'country':country,
+                       'year':year,
+                       'value':value,
+                       'indicator':indicator})
+    
+    return df
+
+def wb_bulk_csv_query(indicators, wdi_csv, countries='all', start_year=config.START_YEAR, end_year=config.END_YEAR,
+                      chunksize=100000):
+    """
+    Read one or more indicators from the World Development Indicators bulk download
+    (WDIData.csv / WDICSV.csv depending on the release, or the zip archive it comes in), see:
+    https://datacatalog.worldbank.org/dataset/world-development-indicators
+    
+    The csv is streamed in chunks and only rows for *indicators* are kept.
+    
+    Outputs
+    -------
+    Pandas DataFrame - Long, with columns for 'country','year','value','indicator', and 'iso'
+    """
+    
+    id_columns = ['Country Name','Country Code','Indicator Code']
+    year_columns = [str(y) for y in range(start_year, end_year + 1)]
+    
+    def read_filtered(f):
+        # --- Only read years within range ---
+        header = pd.read_csv(f, nrows=0).columns
+        usecols = id_columns + [c for c in year_columns if c in header]
+        f.seek(0)
+        
+        # --- Stream and filter ---
+        chunks = []
+        for chunk in pd.read_csv(f, usecols=usecols, chunksize=chunksize):
+            chunk = chunk.loc[chunk['Indicator Code'].isin(indicators)]
+            if countries != 'all':
+                chunk = chunk.loc[chunk['Country Code'].isin(countries)]
+            chunks.append(chunk)
+        return chunks
+    
+    # --- Find the data file within the archive ---
+    if wdi_csv.endswith('.zip'):
+        with zipfile.ZipFile(wdi_csv) as z:
+            members = [n for n in z.namelist() if os.path.basename(n) in ('WDIData.csv','WDICSV.csv')]
+            if len(members) == 0:
+                raise FileNotFoundError(f'No WDIData.csv or WDICSV.csv found in WDI archive {wdi_csv}')
+            with z.open(members[0]) as f:
+                chunks = read_filtered(f)
+    else:
+        with open(wdi_csv, 'rb') as f:
+            chunks = read_filtered(f)
+    wide = pd.concat(chunks, axis='rows')
+    
+    # --- Make long ---
+    df = wide.melt(id_vars=id_columns, var_name='year', value_name='value')
+    df = df.rename({'Country Name':'country', 'Country Code':'iso', 'Indicator Code':'indicator'}, axis='columns')
+    
+    # --- Keep WB codes as iso, aggregates (i.e. 'WLD') aren't ISO countries ---
+    name_dict = {c:helper_functions.iso3_to_country_name(c) for c in df['iso'].unique()}
+    df['iso'] = df['iso'].where(df['iso'].map(name_dict).notnull(), None)
+    
+    # --- Use pycountry names so rows merge with the EIA frames on country ---
+    has_iso = df['iso'].notnull()
+    df.loc[has_iso, 'country'] = df.loc[has_iso, 'iso'].map(name_dict)
+    df = df[['country','year','value','indicator','iso']]
+    
+    return df
+
+def wb_query(indicator, countries='all', start_year=config.START_YEAR, end_year=config.END_YEAR, iso3=True,
+             wdi_csv=None):
+    """
+    Retrieve data for one or more world bank indicators,
     For all world bank indicators, see:
     https://data.worldbank.org/indicator
     
-    Credit to wbdata for a wrapper around API requests: https://wbdata.readthedocs.io/en/latest/
+    Passing a list of indicators fetches them all in one pass, either concurrently from the
+    World Bank API (see wb_api_query()) or from a local bulk download (see wb_bulk_csv_query()).
     
     Input
     -----
-    indicator (str) - the world bank indicator as a string, i.e. '4.1_SHARE.RE.IN.ELECTRICITY' is share of RE in a countries generation mix.
-    countries (list) - Default 'all' will pull all countries, if specifying a single country or a list of countries, double check spelling w/ world bank
+    indicator (str or list) - the world bank indicator(s), i.e. '4.1_SHARE.RE.IN.ELECTRICITY' is share of RE in a countries generation mix.
+    countries (list) - Default 'all' will pull all countries, if specifying a list of countries, use world bank iso codes
     start_year (int) - First year to pull data from, most world bank indicators are reported on an annual basis.
     end_year (int) - Last year to pull data from, most world bank indicators are reported on an annual basis.
+    wdi_csv (str or None) - path to a WDI bulk csv (or zip), if None the API is used.
         
     Outputs
     -------
-    Pandas DataFrame - Long, with columns for 'country','date', and 'value'
+    Pandas DataFrame - Long, with columns for 'country','year','value', and 'indicator'
     """
     
-    # --- Define daterange as tuple ---
-    daterange = (datetime.datetime(start_year, 1, 1), datetime.datetime(end_year, 12, 31))
+    if isinstance(indicator, str):
+        indicator = [indicator]
+    if isinstance(countries, str) and (countries != 'all'):
+        countries = [countries]
     
-    # --- Make api requests ---
-    wb_query = wb.get_data(indicator, data_date=daterange, country=countries)
-    
-    # --- Package results as a df ---
-    country_list = [d['country']['value'] for d in wb_query]
-    year_list = [d['date'] for d in wb_query]
-    value_list = [d['value'] for d in wb_query]
+    # --- Make requests ---
+    if wdi_csv is None:
+        df = wb_api_query(indicator, countries=countries, start_year=start_year, end_year=end_year)
+    else:
+        df = wb_bulk_csv_query(indicator, wdi_csv, countries=countries, start_year=start_year, end_year=end_year)
     
-    df = pd.DataFrame({'country':country_list,
-                       'year':year_list,
-                       'value':value_list})
-    df['indicator'] = indicator
     df['value'] = df['value'].astype(float)
     df['year'] = df['year'].astype(int)
     
-    if iso3:
-        df['iso'] = df['country'].apply(helper_functions.country_name_to_iso3)
+    # --- The bulk csv already has iso codes, the API only has names ---
+    if not iso3:
+        df = df.drop('iso', axis='columns', errors='ignore')
+    elif 'iso' not in df.columns:
+        iso_dict = {c:helper_functions.country_name_to_iso3(c) for c in df['country'].unique()}
+        df['iso'] = df['country'].map(iso_dict)
         
     return df
 
@@ -160,9 +308,17 @@ def load_bp_ng_historical_prices():
     
     return df
 
-def get_gasoline_pump_price():
-    """ Not currently used. """
-    df = wb_query('EP.PMP.SGAS.CD')
+def get_gasoline_pump_price(wb_df=None):
+    """
+    Gasoline pump prices from the world bank.
+    
+    wb_df - optional output of a multi-indicator wb_query that already includes 'EP.PMP.SGAS.CD',
+        to avoid fetching it again. Falls back to fetching if it doesn't.
+    """
+    if wb_df is not None:
+        df = wb_df.loc[wb_df['indicator'] == 'EP.PMP.SGAS.CD'].copy()
+    if (wb_df is None) or (len(df) == 0):
+        df = wb_query('EP.PMP.SGAS.CD')
 
     # --- Clean Results ---
     df = helper_functions.filter_missing_data(df, how=0.2) #drop countries with >20% missing data
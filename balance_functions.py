@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# --- Package Imports ---
+import pandas as pd
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+
+# --- Module Imports ---
+import config
+import helper_functions
+
+def make_cost_matrix(groups, cost_dict=None, intra_cost=0., inter_cost=1.):
+    """
+    Build a square matrix of transport costs between groups (i.e. hubs or continents).
+
+    Inputs
+    ------
+    groups (list) - ordered group names, rows are exporters and columns are importers.
+    cost_dict (dict or None) - {(from_group, to_group): cost} overrides for specific routes.
+    intra_cost (float) - default cost of moving gas within a group.
+    inter_cost (float) - default cost of moving gas between two different groups.
+
+    Outputs
+    -------
+    np.array - shape (len(groups), len(groups))
+    """
+
+    cost = np.full((len(groups), len(groups)), inter_cost, dtype=float)
+    np.fill_diagonal(cost, intra_cost)
+
+    if cost_dict is not None:
+        group_pos = {g:i for i, g in enumerate(groups)}
+        for (from_group, to_group), c in cost_dict.items():
+            if (from_group in group_pos) and (to_group in group_pos):
+                cost[group_pos[from_group], group_pos[to_group]] = c
+
+    return cost
+
+def solve_group_flows(supply, demand, cost, unmet_penalty=1e6):
+    """
+    Solve a min-cost transportation problem between groups for every year at once.
+
+    Each year is an independent block of one sparse LP, so the full horizon is
+    handed to HiGHS in a single call rather than re-solved year by year.
+    Unmet demand is priced at *unmet_penalty* so the problem is always feasible.
+
+    Inputs
+    ------
+    supply (np.array) - shape (years, groups), exportable surplus per group.
+    demand (np.array) - shape (years, groups), deficit per group.
+    cost (np.array) - shape (groups, groups), see make_cost_matrix()
+    unmet_penalty (float) - cost per unit of deficit left uncovered.
+
+    Outputs
+    -------
+    flows (np.array) - shape (years, groups, groups), exporter group to importer group.
+    unmet (np.array) - shape (years, groups), deficit left uncovered.
+    """
+
+    n_years, n_groups = supply.shape
+    n_x = n_years * n_groups * n_groups
+    n_u = n_years * n_groups
+
+    # --- Position of each flow variable ---
+    x_idx = np.arange(n_x)
+    t = x_idx // (n_groups * n_groups)
+    i = (x_idx // n_groups) % n_groups
+    j = x_idx % n_groups
+    u_idx = np.arange(n_u)
+
+    # --- Exports from a group can't exceed its supply ---
+    A_ub = sparse.csr_matrix((np.ones(n_x), (t * n_groups + i, x_idx)), shape=(n_u, n_x + n_u))
+
+    # --- Imports plus unmet demand equal each group's deficit ---
+    rows = np.concatenate([t * n_groups + j, u_idx])
+    cols = np.concatenate([x_idx, n_x + u_idx])
+    A_eq = sparse.csr_matrix((np.ones(n_x + n_u), (rows, cols)), shape=(n_u, n_x + n_u))
+
+    c = np.concatenate([np.tile(cost.ravel(), n_years), np.full(n_u, unmet_penalty)])
+
+    res = linprog(c, A_ub=A_ub, b_ub=supply.ravel(), A_eq=A_eq, b_eq=demand.ravel(),
+                  bounds=(0, None), method='highs')
+    if not res.success:
+        raise RuntimeError('Supply-demand balance failed: {}'.format(res.message))
+
+    flows = res.x[:n_x].reshape(n_years, n_groups, n_groups)
+    unmet = res.x[n_x:].reshape(n_years, n_groups)
+
+    return flows, unmet
+
+def balance_supply_demand(df, map_column='hub', map_dict=config.BP_GAS_HUB_DICT,
+                          cost_dict=None, intra_cost=0., inter_cost=1., unmet_penalty=1e6,
+                          cap_reserves=True):
+    """
+    Allocate positive surpluses (exporters) to negative surpluses (importers) for every year.
+
+    Trade is solved between groups of *map_column* (hubs by default) as a min-cost flow,
+    then split pro-rata across the countries in each group. Because costs only depend on
+    the group, this gives the same total cost as a country-to-country solve with a far
+    smaller LP.
+
+    Inputs
+    ------
+    df - Contains 'country', 'iso', 'year', 'surplus', and optionally 'reserves_forecast'.
+    map_column - column to group countries by, 'hub' or 'continent'.
+        If 'hub' is missing, it is built from continents with *map_dict*.
+    map_dict - map of continents to most economically influential hub
+    cost_dict - {(from_group, to_group): cost} transport cost weights, see make_cost_matrix()
+    intra_cost - cost of trade within a group.
+    inter_cost - cost of trade between groups, unless overridden by cost_dict.
+    unmet_penalty - cost per unit of deficit that can't be covered.
+    cap_reserves - if True, exports can't exceed the remaining 'reserves_forecast'.
+
+    Outputs
+    -------
+    df - input with 'exportable_surplus', 'deficit', 'exports_allocated',
+        'imports_allocated' and 'unmet_deficit' columns added.
+    flows - Long, with columns for 'year', exporter and importer 'country'/'iso', and 'flow'.
+    """
+
+    df = df.dropna(subset=['surplus']).reset_index(drop=True)
+
+    # --- Find group for each country ---
+    if map_column not in df.columns:
+        if 'continent' not in df.columns:
+            df['continent'] = df['country'].apply(helper_functions.country_to_continent)
+        if map_column == 'hub':
+            df['hub'] = df['continent'].map(map_dict)
+        elif map_column != 'continent':
+            raise NotImplementedError
+    df = df.dropna(subset=[map_column]).reset_index(drop=True)
+
+    # --- Exportable surplus and deficit ---
+    df['exportable_surplus'] = df['surplus'].clip(lower=0)
+    if cap_reserves and ('reserves_forecast' in df.columns):
+        remaining = df['reserves_forecast'].fillna(0).clip(lower=0)
+        df['exportable_surplus'] = np.minimum(df['exportable_surplus'], remaining)
+    df['deficit'] = (-df['surplus']).clip(lower=0)
+
+    # --- Index rows by year and group ---
+    years = np.sort(df['year'].unique())
+    groups = sorted(df[map_column].unique())
+    t_idx = pd.Categorical(df['year'], categories=years).codes
+    g_idx = pd.Categorical(df[map_column], categories=groups).codes
+
+    supply = np.zeros((len(years), len(groups)))
+    demand = np.zeros((len(years), len(groups)))
+    np.add.at(supply, (t_idx, g_idx), df['exportable_surplus'].values)
+    np.add.at(demand, (t_idx, g_idx), df['deficit'].values)
+
+    # --- Solve ---
+    cost = make_cost_matrix(groups, cost_dict=cost_dict, intra_cost=intra_cost, inter_cost=inter_cost)
+    flows, unmet = solve_group_flows(supply, demand, cost, unmet_penalty=unmet_penalty)
+
+    # --- Split group results across countries ---
+    group_supply = supply[t_idx, g_idx]
+    group_demand = demand[t_idx, g_idx]
+    exp_share = np.divide(df['exportable_surplus'].values, group_supply,
+                          out=np.zeros(len(df)), where=group_supply > 0)
+    imp_share = np.divide(df['deficit'].values, group_demand,
+                          out=np.zeros(len(df)), where=group_demand > 0)
+
+    df['exports_allocated'] = flows.sum(axis=2)[t_idx, g_idx] * exp_share
+    df['imports_allocated'] = flows.sum(axis=1)[t_idx, g_idx] * imp_share
+    df['unmet_deficit'] = unmet[t_idx, g_idx] * imp_share
+
+    # --- Country to country flows ---
+    t, i, j = np.nonzero(flows > 0)
+    group_flows = pd.DataFrame({'year':years[t],
+                                'exporter_group':np.array(groups)[i],
+                                'importer_group':np.array(groups)[j],
+                                'group_flow':flows[t, i, j]})
+
+    exporters = df.loc[exp_share > 0, ['year', map_column, 'country', 'iso']]
+    exporters['exporter_share'] = exp_share[exp_share > 0]
+    exporters.columns = ['year', 'exporter_group', 'exporter_country', 'exporter_iso', 'exporter_share']
+
+    importers = df.loc[imp_share > 0, ['year', map_column, 'country', 'iso']]
+    importers['importer_share'] = imp_share[imp_share > 0]
+    importers.columns = ['year', 'importer_group', 'importer_country', 'importer_iso', 'importer_share']
+
+    flow_df = group_flows.merge(exporters, on=['year','exporter_group'], how='inner')
+    flow_df = flow_df.merge(importers, on=['year','importer_group'], how='inner')
+    flow_df['flow'] = flow_df['group_flow'] * flow_df['exporter_share'] * flow_df['importer_share']
+
+    # --- Clean up ---
+    flow_df = flow_df[['year','exporter_group','exporter_country','exporter_iso',
+                       'importer_group','importer_country','importer_iso','flow']]
+
+    return df, flow_df
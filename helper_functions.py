@@ -111,7 +111,7 @@ def country_to_continent(country_name):
 
 
 def join_historic_ng_price(df, source='BP', map_dict=config.BP_GAS_HUB_DICT, map_column='continent',
-                           scaler='gas_pump_price'):
+                           scaler='gas_pump_price', wb_df=None):
     """
     Create a new 'ng_price' column for historical data points based on a mapping of a column
     (i.e. continent) with a second datafame with annual prices.
@@ -123,6 +123,7 @@ def join_historic_ng_price(df, source='BP', map_dict=config.BP_GAS_HUB_DICT, map
     map_dict - map of continents to most economically influential hub
     map_column - column containing keys of map_dict
     scaler - domestic column to scale regional hub ng price by
+    wb_df - optional output of a multi-indicator wb_query, reused for the gasoline pump price
     
     Outputs
     -------
@@ -151,7 +152,7 @@ def join_historic_ng_price(df, source='BP', map_dict=config.BP_GAS_HUB_DICT, map
                             'Japan':'jkm',
                             'United States':'henryhub'}
         
-        gasoline_pump_price = api_functions.get_gasoline_pump_price()
+        gasoline_pump_price = api_functions.get_gasoline_pump_price(wb_df=wb_df)
         
         df = df.merge(gasoline_pump_price, on=['year','country','iso'], how='left')
         
@@ -15,7 +15,6 @@ import concurrent.futures as cf
 # --- Package Imports ---
 import pandas as pd
 import numpy as np
-import wbdata as wb
     
 # --- Module Imports ---
 import config
@@ -23,8 +22,9 @@ import helper_functions
 import api_functions
 import forecast_functions
 import stats_functions
+import balance_functions
 
-def data_gather_and_forecast(series_id, source, name, threshold=0.5, how='spline', scale=None):
+def data_gather_and_forecast(series_id, source, name, threshold=0.5, how='spline', scale=None, wb_df=None):
     """
     High-level wrapper that performs three steps:
         1) Fetches datapoints for all countries from a *source* API using a *series_id*.
@@ -39,6 +39,8 @@ def data_gather_and_forecast(series_id, source, name, threshold=0.5, how='spline
     threshold: (float, or None) the percent of years a country must have to be included.
     how: (string) the algoritihm for forecasting, will be passed to pandas.dataframe.interpolate
         currently only 'spline' is tested. 
+    wb_df: (pd.DataFrame, or None) output of a multi-indicator wb_query, if provided and source is 'WB'
+        the series is taken from it rather than fetched again.
         
     Examples
     --------
@@ -53,7 +55,10 @@ def data_gather_and_forecast(series_id, source, name, threshold=0.5, how='spline
     if source == "EIA":
         df = api_functions.eia_query_for_countries(series_id)
     elif source == "WB":
-        df = api_functions.wb_query(series_id)
+        if wb_df is None:
+            df = api_functions.wb_query(series_id)
+        else:
+            df = wb_df.loc[wb_df['indicator'] == series_id].copy()
     
     # --- Clean Results ---
     df = helper_functions.filter_missing_data(df, how=threshold) #drop countries with >20% missing data
@@ -81,9 +86,10 @@ ng_consumption = data_gather_and_forecast(series_id="INTL.26-2-{}-BCF.A", source
 #ng_imports = data_gather_and_forecast("INTL.26-3-{}-BCF.A", source="EIA", name="ng_imports") #units: billion cubic feet
 #ng_exports = data_gather_and_forecast("INTL.26-4-{}-BCF.A", source="EIA", name="ng_exports") #units: billion cubic feet
 
-# --- WB Sources ---
-#gdp_per_capita = data_gather_and_forecast('NY.GDP.PCAP.CD', source="WB", name="gdp_per_capita")
-#ng_rents = data_gather_and_forecast('NY.GDP.NGAS.RT.ZS', source="WB", name="ng_rents")
+# --- WB Sources (fetched together in one pass) ---
+wb_data = api_functions.wb_query(['NY.GDP.PCAP.CD','NY.GDP.NGAS.RT.ZS','EP.PMP.SGAS.CD'])
+#gdp_per_capita = data_gather_and_forecast('NY.GDP.PCAP.CD', source="WB", name="gdp_per_capita", wb_df=wb_data)
+#ng_rents = data_gather_and_forecast('NY.GDP.NGAS.RT.ZS', source="WB", name="ng_rents", wb_df=wb_data)
 
 # --- NG Reserves Without Forecast---
 ng_reserves = api_functions.eia_query_for_countries("INTL.3-6-{}-TCF.A") #units: trillion cubic feet
@@ -123,7 +129,10 @@ forecast['cons_yrs_reserves'] = forecast['reserves_forecast'] / forecast['ng_con
 forecast = forecast.dropna(subset=['ng_production','ng_consumption','reserves_forecast'])
 
 # --- Join on historic ng prices ---
-forecast = helper_functions.join_historic_ng_price(forecast)
+forecast = helper_functions.join_historic_ng_price(forecast, wb_df=wb_data)
+
+# --- Allocate surpluses to deficits within / across hubs ---
+ng_balances, ng_flows = balance_functions.balance_supply_demand(forecast, map_column='hub')
 
 #%%
 import importlib